@@ -1,124 +1,194 @@
-import yfinance as yf
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from datetime import timedelta
+from numba import njit
+from datetime import date, timedelta
+from pathlib import Path
 import argparse
 import sys
 
+_rng = np.random.default_rng()
+CACHE_DIR = Path.home() / '.cache' / 'stockanalysis'
+
 def fetch_stock_data(ticker_name, history_period):
     """
     Fetch stock data using the yfinance library.
+    Results are cached on disk per ticker, period and day.
     """
+    cache_file = CACHE_DIR / f"{ticker_name}_{history_period}_{date.today():%Y%m%d}.pkl"
+    if cache_file.exists():
+        return pd.read_pickle(cache_file)
+
+    import yfinance as yf  # Imported lazily, only needed when downloading
+
     try:
-        ticker = yf.Ticker(ticker_name)
-        data = ticker.history(period=history_period, interval="1d")
+        data = yf.download(ticker_name, period=history_period, interval="1d", auto_adjust=True,
+                           actions=False, progress=False, multi_level_index=False)
     except Exception as e:
         print(f"Error fetching data for ticker '{ticker_name}': {e}")
         sys.exit(1)
+    if data is None or data.empty:
+        print(f"Error fetching data for ticker '{ticker_name}': no data returned.")
+        sys.exit(1)
 
-    # Reset index and format the data
-    data.reset_index(inplace=True)
-    data = data[['Date', 'Open']]
-    data.rename(columns={'Open': 'Opening Price'}, inplace=True)
-    data['Date'] = pd.to_datetime(data['Date'])
-    data['Date'] = data['Date'].dt.strftime('%Y-%m-%d')
+    # Build each column as its own 1D array instead of slicing the 2D OHLCV block
+    data = pd.DataFrame({
+        'Date': pd.Series(data.index.tz_localize(None)),  # Keep as datetime64, drop the exchange timezone
+        'Opening Price': pd.Series(data['Open'].to_numpy())
+    })
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    data.to_pickle(cache_file)
     return data
 
-def process_stock_data(data, num_months, ticker_name, history_period):
+def build_results(dates, prices):
+    """
+    Build a Date/Opening Price/Month results table from selected column arrays.
+    """
+    dates = pd.Series(dates)
+    return pd.DataFrame({
+        'Date': dates,
+        'Opening Price': pd.Series(prices),
+        'Month': dates.dt.strftime('%Y-%m')
+    })
+
+@njit(cache=True)
+def select_topk_below_mean(month_ids, prices, k=3, inclusive=False):
+    """
+    Return the row indices of the k lowest prices below each month's average,
+    lowest first. With inclusive=True prices equal to the average also qualify.
+    Rows of the same month must be contiguous, as they are in date order.
+    """
+    n = prices.size
+
+    # Count the months first so scratch and output arrays hold one slot per month
+    num_months = 1 if n > 0 else 0
+    for i in range(1, n):
+        if month_ids[i] != month_ids[i - 1]:
+            num_months += 1
+
+    # First pass: find each month's run of rows and its price total
+    starts = np.empty(num_months + 1, dtype=np.int64)
+    counts = np.zeros(num_months, dtype=np.int64)
+    totals = np.zeros(num_months, dtype=np.float64)
+    month = -1
+    for i in range(n):
+        if i == 0 or month_ids[i] != month_ids[i - 1]:
+            month += 1
+            starts[month] = i
+        if not np.isnan(prices[i]):  # Missing prices are skipped, as pandas mean() does
+            counts[month] += 1
+            totals[month] += prices[i]
+    starts[num_months] = n
+
+    # Second pass: keep the k smallest qualifying prices per month, in ascending order
+    out = np.empty(k * num_months, dtype=np.int64)
+    best = np.empty(k, dtype=np.int64)
+    count = 0
+    for month in range(num_months):
+        if counts[month] == 0:
+            continue
+        monthly_avg = totals[month] / counts[month]
+        size = 0
+        for i in range(starts[month], starts[month + 1]):
+            price = prices[i]
+            if np.isnan(price) or price > monthly_avg or (price == monthly_avg and not inclusive):
+                continue
+            if size < k:
+                size += 1
+            elif price >= prices[best[k - 1]]:
+                continue
+            pos = size - 1
+            while pos > 0 and prices[best[pos - 1]] > price:
+                best[pos] = best[pos - 1]
+                pos -= 1
+            best[pos] = i
+
+        out[count:count + size] = best[:size]
+        count += size
+    return out[:count]
+
+def write_csv(df, path):
+    """
+    Write a DataFrame to CSV with dates formatted as YYYY-MM-DD.
+    """
+    df.to_csv(path, index=False, date_format='%Y-%m-%d', lineterminator='\n')
+
+def process_stock_data(data, num_months, ticker_name, history_period, seed=None):
     """
     Process stock data to analyze best buy and sell dates.
+    Pass a seed to make the simulated future prices reproducible.
     """
-    # Ensure proper formatting of columns
-    data['Date'] = pd.to_datetime(data['Date'])
-    data.sort_values('Date', inplace=True)
-    data['YearMonth'] = data['Date'].dt.to_period('M').astype(str)
+    # Ensure proper formatting of columns; yfinance data normally arrives sorted
+    if not data['Date'].is_monotonic_increasing:
+        data.sort_values('Date', inplace=True, kind='mergesort')
+    data['YearMonth'] = data['Date'].dt.year * 12 + data['Date'].dt.month  # Integer month key for fast grouping
 
     # Analyze each month for best buy dates
-    results = []
-    for group, monthly_data in data.groupby('YearMonth'):
-        monthly_avg = monthly_data['Opening Price'].mean()
-        low_price_days = monthly_data[monthly_data['Opening Price'] < monthly_avg]
-        low_price_days = low_price_days.nsmallest(3, 'Opening Price')
-        for _, row in low_price_days.iterrows():
-            results.append({
-                'Date': row['Date'],
-                'Opening Price': row['Opening Price'],
-                'Month': group
-            })
+    best_buy_index = select_topk_below_mean(data['YearMonth'].to_numpy(np.int64), data['Opening Price'].to_numpy(np.float64))
 
     # Save historical best buy dates
-    results_df = pd.DataFrame(results)
+    results_df = build_results(data['Date'].to_numpy()[best_buy_index], data['Opening Price'].to_numpy()[best_buy_index])
     historical_output_file = f"{ticker_name}_{history_period}_best_buy_dates.csv"
-    results_df.to_csv(historical_output_file, index=False)
+    write_csv(results_df, historical_output_file)
     print(f"Historical best buy dates saved to '{historical_output_file}'.")
 
     # Predict future prices
     last_date = data['Date'].max()
-    recent_stats = data.tail(90)['Opening Price']  # Use last 90 days for trend analysis
-    recent_avg = recent_stats.mean()
-    recent_std = recent_stats.std()
-    trend = (recent_stats.iloc[-1] - recent_stats.iloc[0]) / len(recent_stats)  # Price change per day
-
-    future_dates = pd.date_range(start=last_date + timedelta(days=1), periods=num_months * 30)
-
-    future_data = []
-    for future_date in future_dates:
-        month_key = f"{future_date.year}-{future_date.month:02d}"
-        avg_price = recent_avg + trend * (future_date - last_date).days
-        volatility = recent_std
-        simulated_price = np.random.normal(avg_price, volatility)
-        simulated_price = max(simulated_price, recent_avg * 0.8)  # Avoid very low prices
-        simulated_price = min(simulated_price, recent_avg * 1.2)  # Avoid overly high prices
-        future_data.append({'Date': future_date, 'Opening Price': simulated_price})
-
-    future_df = pd.DataFrame(future_data)
-    future_df['YearMonth'] = future_df['Date'].dt.to_period('M').astype(str)
+    recent_stats = data['Opening Price'].to_numpy(np.float64)[-90:]  # Use last 90 days for trend analysis
+    recent_avg = np.nanmean(recent_stats)  # Skip missing prices, as Series.mean() does
+    recent_std = np.nanstd(recent_stats, ddof=1)
+    trend = (recent_stats[-1] - recent_stats[0]) / recent_stats.size  # Price change per trading day
+
+    # Simulate trading days only, roughly 22 business days per month
+    future_dates = pd.bdate_range(start=last_date + timedelta(days=1), periods=num_months * 22)
+    future_months = future_dates.year.to_numpy(np.int64) * 12 + future_dates.month.to_numpy(np.int64)
+
+    # Simulate all future prices in a single vectorized draw
+    rng = _rng if seed is None else np.random.default_rng(seed)
+    days = np.arange(1, len(future_dates) + 1, dtype=np.float64)
+    avg_price = recent_avg + trend * days
+    simulated_prices = rng.normal(loc=avg_price, scale=recent_std, size=days.size)
+    np.clip(simulated_prices, recent_avg * 0.8, recent_avg * 1.2, out=simulated_prices)  # Avoid very low/high prices
+
+    future_df = pd.DataFrame({
+        'Date': pd.Series(future_dates),
+        'Opening Price': pd.Series(simulated_prices),
+        'YearMonth': pd.Series(future_months)
+    })
 
     # Predict best buy and sell dates
-    predicted_buy_results = []
-    predicted_sell_results = []
-
-    for group, monthly_data in future_df.groupby('YearMonth'):
-        monthly_avg = monthly_data['Opening Price'].mean()
-
-        # Best Buy Dates: Lowest 3 prices
-        low_price_days = monthly_data[monthly_data['Opening Price'] <= monthly_avg]
-        low_price_days = low_price_days.nsmallest(3, 'Opening Price')
-        for _, row in low_price_days.iterrows():
-            predicted_buy_results.append({
-                'Date': row['Date'],
-                'Opening Price': row['Opening Price'],
-                'Month': group
-            })
-
-        # Best Sell Dates: Highest 3 prices
-        high_price_days = monthly_data.nlargest(3, 'Opening Price')
-        for _, row in high_price_days.iterrows():
-            predicted_sell_results.append({
-                'Date': row['Date'],
-                'Opening Price': row['Opening Price'],
-                'Month': group
-            })
+    # Best Buy Dates: Lowest 3 prices at or below the monthly average
+    predicted_buy_index = select_topk_below_mean(future_months, simulated_prices, inclusive=True)
+
+    # Best Sell Dates: Highest 3 prices, earliest date first among ties
+    high_price_days = future_df.sort_values(['YearMonth', 'Opening Price'], ascending=[True, False], kind='mergesort')
+    high_price_days = high_price_days.groupby('YearMonth', sort=False).head(3)
 
     # Save predicted best buy and sell dates
-    predicted_buy_df = pd.DataFrame(predicted_buy_results)
-    predicted_sell_df = pd.DataFrame(predicted_sell_results)
+    predicted_buy_df = build_results(future_dates[predicted_buy_index], simulated_prices[predicted_buy_index])
+    predicted_sell_df = build_results(high_price_days['Date'].to_numpy(), high_price_days['Opening Price'].to_numpy())
 
     predicted_buy_file = f"{ticker_name}_{history_period}_predicted_best_buy_dates.csv"
     predicted_sell_file = f"{ticker_name}_{history_period}_predicted_best_sell_dates.csv"
 
-    predicted_buy_df.to_csv(predicted_buy_file, index=False)
-    predicted_sell_df.to_csv(predicted_sell_file, index=False)
+    write_csv(predicted_buy_df, predicted_buy_file)
+    write_csv(predicted_sell_df, predicted_sell_file)
 
     print(f"Predicted best buy dates saved to '{predicted_buy_file}'.")
     print(f"Predicted best sell dates saved to '{predicted_sell_file}'.")
 
     # Visualization
+    import matplotlib.pyplot as plt  # Imported lazily to keep startup fast
+    import matplotlib.dates as mdates
+
+    # Convert dates to matplotlib's numeric format once instead of per point
     plt.figure(figsize=(12, 6))
-    plt.scatter(results_df['Date'], results_df['Opening Price'], color='blue', label='Historical Best Buy Dates', zorder=5)
-    plt.scatter(predicted_buy_df['Date'], predicted_buy_df['Opening Price'], color='green', label='Predicted Best Buy Dates', zorder=5)
-    plt.scatter(predicted_sell_df['Date'], predicted_sell_df['Opening Price'], color='red', label='Predicted Best Sell Dates', zorder=5)
+    for df, color, label in [(results_df, 'blue', 'Historical Best Buy Dates'),
+                             (predicted_buy_df, 'green', 'Predicted Best Buy Dates'),
+                             (predicted_sell_df, 'red', 'Predicted Best Sell Dates')]:
+        x = mdates.date2num(df['Date'].to_numpy())
+        plt.scatter(x, df['Opening Price'].to_numpy(), color=color, label=label, zorder=5)
+    plt.gca().xaxis_date()
     plt.xlabel('Date')
     plt.ylabel('Opening Price')
     plt.title(f'Historical and Predicted Best Buy/Sell Dates for {ticker_name}')
@@ -132,6 +202,7 @@ def main():
     parser.add_argument("ticker", type=str, help="Yahoo Finance ticker symbol.")
     parser.add_argument("history_period", type=str, help="Time period for historical data (e.g., '5y', '1y').")
     parser.add_argument("num_months", type=int, help="Number of months to predict future best buy/sell dates.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible price predictions.")
     args = parser.parse_args()
 
     # Fetch stock data
@@ -140,11 +211,11 @@ def main():
 
     # Save fetched data to CSV
     input_csv_file = f"{args.ticker}_{args.history_period}_data.csv"
-    stock_data.to_csv(input_csv_file, index=False)
+    write_csv(stock_data, input_csv_file)
     print(f"Fetched stock data saved to '{input_csv_file}'.")
 
     # Process stock data
-    process_stock_data(stock_data, args.num_months, args.ticker, args.history_period)
+    process_stock_data(stock_data, args.num_months, args.ticker, args.history_period, seed=args.seed)
 
 if __name__ == "__main__":
     main()